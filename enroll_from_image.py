@@ -1,11 +1,23 @@
 import cv2
 import argparse
+import csv
 import os
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from utils import face_utils, tts # Assuming tts might be used for confirmation
 
 # Configuration
-DB_PATH = face_utils.KNOWN_FACES_PKL
+DB_PATH = face_utils.KNOWN_FACES_DB
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+BATCH_WORKERS = 4 # Images read and run through the model concurrently in folder/manifest mode
+
+def select_largest_face(detected_faces):
+    """Returns the face with the largest bounding box area."""
+    if not detected_faces:
+        return None
+    bboxes = np.array([face_obj.bbox for face_obj in detected_faces], dtype=np.float32)
+    areas = (bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])
+    return detected_faces[int(areas.argmax())]
 
 def enroll_from_image(image_path, person_name):
     """
@@ -51,15 +63,7 @@ def enroll_from_image(image_path, person_name):
         print(f"Warning: {len(detected_faces)} faces detected in the image.")
         print("Attempting to use the largest face for enrollment.")
         
-        largest_face_area = 0
-        for face_obj in detected_faces:
-            bbox = face_obj.bbox
-            x1, y1, x2, y2 = bbox
-            area = (x2 - x1) * (y2 - y1)
-            if area > largest_face_area:
-                largest_face_area = area
-                target_face_obj = face_obj
-        
+        target_face_obj = select_largest_face(detected_faces)
         if target_face_obj:
             print("Largest face selected for enrollment.")
         else:
@@ -74,8 +78,8 @@ def enroll_from_image(image_path, person_name):
         return False
 
     # 6. Load known faces database
-    known_faces_db = face_utils.load_known_faces(DB_PATH)
-    enrolled_names = {face['name'] for face in known_faces_db}
+    known_names, known_embeddings = face_utils.load_known_faces(DB_PATH)
+    enrolled_names = set(known_names)
 
     # 7. Handle name and save
     name_to_enroll = person_name.strip()
@@ -89,12 +93,12 @@ def enroll_from_image(image_path, person_name):
             print(f"Enrollment for '{name_to_enroll}' skipped.")
             return False
         else:
-            # Remove old entry to overwrite
-            known_faces_db = [f for f in known_faces_db if f['name'] != name_to_enroll]
             print(f"Preparing to overwrite existing entry for '{name_to_enroll}'.")
     
-    known_faces_db.append({"name": name_to_enroll, "embedding": embedding})
-    face_utils.save_known_faces(known_faces_db, DB_PATH)
+    # Replaces the old entry when overwriting
+    known_names, known_embeddings = face_utils.update_known_faces(known_names, known_embeddings,
+                                                                  {name_to_enroll: embedding})
+    face_utils.save_known_faces((known_names, known_embeddings), DB_PATH)
     
     success_message = f"Successfully enrolled: {name_to_enroll} from image {os.path.basename(image_path)}"
     print(success_message)
@@ -102,16 +106,120 @@ def enroll_from_image(image_path, person_name):
     return True
 
 
+def _extract_embedding(image_path, model):
+    """
+    Reads an image and returns the embedding of its largest face, or None.
+    Runs on worker threads in batch mode; the ONNX Runtime sessions are thread-safe.
+    """
+    image = cv2.imread(image_path)
+    if image is None:
+        print(f"Error: Could not read image from path: {image_path}")
+        return None
+
+    detected_faces = face_utils.get_faces_from_frame(image, model)
+    if not detected_faces:
+        print(f"Error: No faces detected in {image_path}.")
+        return None
+    if len(detected_faces) > 1:
+        print(f"Warning: {len(detected_faces)} faces detected in {image_path}. Using the largest one.")
+
+    target_face_obj = select_largest_face(detected_faces)
+    if target_face_obj is None or target_face_obj.normed_embedding is None:
+        print(f"Error: Could not extract embedding for the face in {image_path}.")
+        return None
+    return target_face_obj.normed_embedding
+
+def load_manifest(manifest_path):
+    """
+    Reads a CSV manifest with 'image,name' rows (a header row with those names is optional).
+    Returns a dict mapping image path to person name.
+    """
+    name_map = {}
+    with open(manifest_path, newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or row[0].strip().lower() == 'image':
+                continue
+            name_map[row[0].strip()] = row[1].strip()
+    return name_map
+
+def enroll_from_folder(folder, name_map=None, overwrite=False):
+    """
+    Enrolls every face image in a folder, loading the model and the database once.
+    - name_map: optional dict of image path (relative to folder) to person name.
+      Without it, every image in the folder is enrolled under its file name (without extension).
+    - overwrite: replace existing entries with the same name instead of skipping them.
+    Returns the number of faces enrolled.
+    """
+    if name_map is None:
+        if not os.path.isdir(folder):
+            print(f"Error: Folder not found: {folder}")
+            return 0
+        name_map = {fname: os.path.splitext(fname)[0] for fname in sorted(os.listdir(folder))
+                    if fname.lower().endswith(IMAGE_EXTENSIONS)}
+    if not name_map:
+        print(f"Error: No images to enroll in {folder}.")
+        return 0
+
+    print("Loading InsightFace model for enrollment...")
+    model = face_utils.load_insightface_model()
+    if model is None:
+        print("Failed to load InsightFace model. Exiting enrollment.")
+        return 0
+
+    image_paths = [os.path.join(folder, image) for image in name_map]
+    print(f"Processing {len(image_paths)} images...")
+    with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as executor:
+        embeddings = list(executor.map(lambda path: _extract_embedding(path, model), image_paths))
+
+    known_names, known_embeddings = face_utils.load_known_faces(DB_PATH)
+    enrolled_names = set(known_names)
+    new_entries = {}
+    for (image, person_name), embedding in zip(name_map.items(), embeddings):
+        name_to_enroll = person_name.strip()
+        if embedding is None or not name_to_enroll:
+            print(f"Skipping {image}.")
+            continue
+        if name_to_enroll in enrolled_names and not overwrite:
+            print(f"Name '{name_to_enroll}' already exists. Skipping {image} (use --overwrite to replace).")
+            continue
+        if name_to_enroll in new_entries:
+            print(f"Warning: '{name_to_enroll}' appears more than once. Using {image}.")
+        new_entries[name_to_enroll] = embedding
+
+    if not new_entries:
+        print("No faces were enrolled.")
+        return 0
+
+    known_names, known_embeddings = face_utils.update_known_faces(known_names, known_embeddings, new_entries)
+    face_utils.save_known_faces((known_names, known_embeddings), DB_PATH)
+
+    print(f"Successfully enrolled {len(new_entries)} faces: {list(new_entries)}")
+    tts.speak(f"{len(new_entries)} faces have been enrolled.")
+    return len(new_entries)
+
+
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Enroll a face from an image file.")
-    parser.add_argument("-i", "--image", required=True, help="Path to the image file containing the face.")
-    parser.add_argument("-n", "--name", required=True, help="Name of the person in the image.")
+    parser = argparse.ArgumentParser(description="Enroll faces from image files.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("-i", "--image", help="Path to the image file containing the face.")
+    source.add_argument("-f", "--folder", help="Enroll every image in this folder, named after the file.")
+    source.add_argument("-m", "--manifest", help="CSV file of 'image,name' rows; image paths are relative to the CSV.")
+    parser.add_argument("-n", "--name", help="Name of the person in the image (required with --image).")
+    parser.add_argument("--overwrite", action="store_true", help="Replace existing names in folder/manifest mode.")
     
     args = parser.parse_args()
 
-    enroll_from_image(args.image, args.name)
+    if args.image:
+        if not args.name:
+            parser.error("--name is required with --image")
+        enroll_from_image(args.image, args.name)
+    elif args.folder:
+        enroll_from_folder(args.folder, overwrite=args.overwrite)
+    else:
+        enroll_from_folder(os.path.dirname(os.path.abspath(args.manifest)), load_manifest(args.manifest),
+                           overwrite=args.overwrite)
 
     # Create a dummy test_face for demo if not exists (similar to face_enroll.py)
     if not os.path.exists(DB_PATH):
-        print("\nNote: No 'known_faces.pkl' found. A new one will be created upon successful enrollment.")
-        print("If this is the first enrollment, 'known_faces.pkl' will be created.")
\ No newline at end of file
+        print("\nNote: No 'known_faces.npz' found. A new one will be created upon successful enrollment.")
+        print("If this is the first enrollment, 'known_faces.npz' will be created.")
\ No newline at end of file
@@ -5,7 +5,7 @@ import numpy as np
 from utils import camera_utils, face_utils, tts
 
 # Configuration
-DB_PATH = face_utils.KNOWN_FACES_PKL
+DB_PATH = face_utils.KNOWN_FACES_DB
 CAPTURE_KEY = ord('s')
 QUIT_KEY = ord('q')
 MIN_FACE_SIZE_ENROLL = (60, 60)
@@ -18,15 +18,17 @@ def enroll_face():
     if model is None:
         print("Failed to load InsightFace model. Exiting enrollment.")
         return
+    face_utils.warmup(model)
 
-    known_faces_db = face_utils.load_known_faces(DB_PATH)
-    enrolled_names = {face['name'] for face in known_faces_db}
+    known_names, known_embeddings = face_utils.load_known_faces(DB_PATH)
+    enrolled_names = set(known_names)
 
     print("Initializing camera for enrollment...")
     cap = camera_utils.get_camera()
     if cap is None:
         print("Failed to access camera. Exiting enrollment.")
         return
+    cam = camera_utils.ThreadedCamera(cap)
 
     cv2.namedWindow("VINA-Face Enrollment", cv2.WINDOW_AUTOSIZE)
     print("\nEnrollment Instructions:")
@@ -39,17 +41,23 @@ def enroll_face():
     last_preview_detection_time = 0 # For throttling preview updates
     
     target_face_obj_for_preview = None # Keep the last known preview target
+    display_frame = None # Reused buffer for the annotated preview
 
     while True:
-        ret, live_frame = cap.read()
+        ret, live_frame = cam.read()
+        if ret is None:
+            continue # No new frame yet; keep waiting
         if not ret or live_frame is None:
             print("Error: Failed to capture frame from camera.")
             time.sleep(0.1)
             continue
         
-        display_frame = live_frame.copy()
+        if display_frame is None or display_frame.shape != live_frame.shape:
+            display_frame = np.empty_like(live_frame)
+        np.copyto(display_frame, live_frame) # Annotations must not end up on live_frame, which may be enrolled
         frame_h, frame_w = live_frame.shape[:2]
-        current_time = time.time()
+        frame_center_x, frame_center_y = frame_w * 0.5, frame_h * 0.5
+        current_time = time.monotonic()
 
         # --- Throttled Face detection on the LIVE feed for visual feedback ---
         if current_time - last_preview_detection_time > PREVIEW_DETECTION_INTERVAL:
@@ -57,14 +65,14 @@ def enroll_face():
             # print("Running preview detection...") # Debug print
             detected_faces_for_preview = face_utils.get_faces_from_frame(live_frame, model)
             if detected_faces_for_preview:
-                target_face_obj_for_preview = face_utils.get_center_most_face(detected_faces_for_preview, frame_w, frame_h)
+                target_face_obj_for_preview = face_utils.get_center_most_face(detected_faces_for_preview,
+                                                                              frame_center_x, frame_center_y)
             else:
                 target_face_obj_for_preview = None # Clear if no faces detected in this interval
         
         # --- Draw based on the (potentially stale but recently updated) target_face_obj_for_preview ---
         if target_face_obj_for_preview:
-            bbox = target_face_obj_for_preview.bbox.astype(int)
-            x1, y1, x2, y2 = bbox
+            x1, y1, x2, y2 = target_face_obj_for_preview.bbox.astype(int).tolist()
             face_w, face_h = x2 - x1, y2 - y1
 
             cv2.rectangle(display_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
@@ -82,7 +90,7 @@ def enroll_face():
         key = cv2.waitKey(1) & 0xFF # Crucial: Keep waitKey low for responsive GUI
 
         if key == CAPTURE_KEY:
-            capture_press_time = time.time() # Renamed current_time to avoid conflict
+            capture_press_time = time.monotonic() # Renamed current_time to avoid conflict
             if capture_press_time - last_capture_attempt_time < CAPTURE_COOLDOWN:
                 print("Please wait a moment before capturing again.")
                 continue
@@ -105,7 +113,7 @@ def enroll_face():
                 continue
 
             actual_target_face_obj_for_enrollment = face_utils.get_center_most_face(
-                detected_faces_on_frozen_frame, frame_w, frame_h
+                detected_faces_on_frozen_frame, frame_center_x, frame_center_y
             )
 
             if not actual_target_face_obj_for_enrollment:
@@ -160,11 +168,11 @@ def enroll_face():
                 if overwrite_input != 'y':
                     print(f"Skipping enrollment for {name}.")
                     continue
-                else:
-                    known_faces_db = [f for f in known_faces_db if f['name'] != name]
             
-            known_faces_db.append({"name": name, "embedding": embedding})
-            face_utils.save_known_faces(known_faces_db, DB_PATH)
+            # Replaces any existing entry with the same name
+            known_names, known_embeddings = face_utils.update_known_faces(known_names, known_embeddings,
+                                                                          {name: embedding})
+            face_utils.save_known_faces((known_names, known_embeddings), DB_PATH)
             enrolled_names.add(name)
             success_message = f"Successfully enrolled: {name}"
             print(success_message)
@@ -174,6 +182,7 @@ def enroll_face():
             print("Exiting enrollment system.")
             break
 
+    cam.stop()
     cap.release()
     cv2.destroyAllWindows()
 
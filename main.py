@@ -1,4 +1,6 @@
 import cv2
+import queue
+import threading
 import time
 import numpy as np
 from utils import camera_utils, face_utils, tts, zoom_utils
@@ -7,7 +9,14 @@ from utils import camera_utils, face_utils, tts, zoom_utils
 SIMILARITY_THRESHOLD = 0.50
 ZOOM_DURATION_SECONDS = 1.7
 GREETING_COOLDOWN_SECONDS = 5
-DETECTION_INTERVAL_SECONDS = 0.1
+DETECTION_INTERVAL_SECONDS = 0.1 # While searching for a face to recognize
+TRACKING_DETECTION_INTERVAL_SECONDS = 0.5 # While a recognized face is in view
+TRACKING_LOST_TIMEOUT_SECONDS = 1.0 # No face for this long drops back to searching
+DETECTION_SIZE = (640, 640) # Detector input (width, height); e.g. (320, 320) is ~4x cheaper but misses small/distant faces
+DROPPED_FRAMES_LOG_INTERVAL_SECONDS = 30
+LOW_LIGHT_CHECK_INTERVAL_FRAMES = 30 # How often to re-check whether the scene is dark enough to enhance
+GREETED_PRUNE_INTERVAL_FRAMES = 1000 # How often to forget people whose greeting cooldown is long over
+USE_INT8_MATCHING = False # Match against an int8-quantized copy of the database (4x smaller; fastest with numba)
 
 # --- Global State ---
 # This is defined at the module level, making it global by default.
@@ -15,23 +24,34 @@ USE_LOW_LIGHT_ENHANCEMENT = True # Initial state
 
 last_greeted_time = {}
 insightface_model = None
-known_faces_db = []
+known_faces_names = []
+known_faces_matrix = None
+known_faces_q_matrix = None
+known_faces_q_scales = None
+known_faces_index = None
 
 def initialize_system():
     """Loads models, database, and camera."""
-    global insightface_model, known_faces_db # These are assigned to within this function.
+    global insightface_model, known_faces_names, known_faces_matrix # These are assigned to within this function.
+    global known_faces_q_matrix, known_faces_q_scales, known_faces_index
     
     print("Initializing VINA-Face System...")
-    insightface_model = face_utils.load_insightface_model()
+    insightface_model = face_utils.load_insightface_model(det_size=DETECTION_SIZE)
     if insightface_model is None:
         print("CRITICAL: Failed to load InsightFace model. Exiting.")
         return None, None
+    face_utils.warmup(insightface_model)
+    zoom_utils.warmup()
 
-    known_faces_db = face_utils.load_known_faces()
-    if not known_faces_db:
+    known_faces_names, known_faces_matrix = face_utils.load_known_faces()
+    if USE_INT8_MATCHING:
+        known_faces_q_matrix, known_faces_q_scales = face_utils.quantize_embeddings(known_faces_matrix)
+    else:
+        known_faces_index = face_utils.load_or_build_index(known_faces_matrix) # None if FAISS is not installed
+    if not known_faces_names:
         print("Warning: No known faces in the database. Please enroll faces using face_enroll.py or enroll_from_image.py.")
     else:
-        print(f"Loaded {len(known_faces_db)} known faces: {[f['name'] for f in known_faces_db]}")
+        print(f"Loaded {len(known_faces_names)} known faces: {known_faces_names}")
 
     cap = camera_utils.get_camera()
     if cap is None:
@@ -52,7 +72,7 @@ def process_frame(frame_to_process, model, frame_width, frame_height):
     if not detected_faces:
         return None, None
 
-    target_face_obj = face_utils.get_center_most_face(detected_faces, frame_width, frame_height)
+    target_face_obj = face_utils.get_center_most_face(detected_faces, frame_width * 0.5, frame_height * 0.5)
 
     if not target_face_obj:
         return None, None
@@ -64,22 +84,88 @@ def process_frame(frame_to_process, model, frame_width, frame_height):
         print("Warning: Face detected but embedding could not be extracted.")
         return "Unknown", face_bbox
 
-    if not known_faces_db:
+    if not known_faces_names:
         return "Unknown", face_bbox
 
-    best_match_name = None
-    max_similarity = -1.0
-
-    for known_face in known_faces_db:
-        similarity = face_utils.compare_embeddings(current_embedding, known_face['embedding'])
-        if similarity > SIMILARITY_THRESHOLD and similarity > max_similarity:
-            max_similarity = similarity
-            best_match_name = known_face['name']
-    
-    if best_match_name:
-        return best_match_name, face_bbox
+    # One matrix-vector product (or index query) against the whole database instead of a per-face loop
+    if known_faces_index is not None:
+        best_match_name, _ = face_utils.search_index(current_embedding, known_faces_index,
+                                                     known_faces_names, SIMILARITY_THRESHOLD)
+    elif USE_INT8_MATCHING:
+        best_match_name, _ = face_utils.match_embedding_int8(current_embedding, known_faces_q_matrix,
+                                                             known_faces_q_scales, known_faces_names,
+                                                             SIMILARITY_THRESHOLD)
     else:
-        return "Unknown", face_bbox
+        best_match_name, _ = face_utils.match_embedding(current_embedding, known_faces_matrix,
+                                                        known_faces_names, SIMILARITY_THRESHOLD)
+    return best_match_name, face_bbox
+
+
+def _put_latest(q, item):
+    """Puts item on a bounded queue, discarding the oldest item if the queue is full."""
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass
+
+
+class RecognitionWorker:
+    """
+    Runs contrast enhancement, detection and recognition on a background thread,
+    so the main thread keeps displaying frames while a detection is in flight.
+    Both queues hold a single item: a newer frame or result replaces a stale one.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._frames = queue.Queue(maxsize=1)
+        self._results = queue.Queue(maxsize=1)
+        self._enhance_buf = None # Only touched by the worker thread
+        self._run = True
+        self._thread = threading.Thread(target=self._work, daemon=True)
+        self._thread.start()
+
+    def submit(self, frame, enhance):
+        """Queues a frame for recognition, replacing any frame still waiting."""
+        _put_latest(self._frames, (frame, enhance))
+
+    def poll(self):
+        """Returns the latest (recognized_name, face_bbox) result, or None if there is none yet."""
+        try:
+            return self._results.get_nowait()
+        except queue.Empty:
+            return None
+
+    def _work(self):
+        while self._run:
+            try:
+                frame, enhance = self._frames.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            if enhance:
+                if self._enhance_buf is None or self._enhance_buf.shape != frame.shape:
+                    self._enhance_buf = np.empty_like(frame)
+                processed_frame = camera_utils.enhance_contrast(frame, dst=self._enhance_buf)
+            else:
+                processed_frame = frame
+
+            frame_height, frame_width = frame.shape[:2]
+            try:
+                result = process_frame(processed_frame, self.model, frame_width, frame_height)
+            except Exception as e:
+                print(f"Error during face recognition: {e}")
+                result = (None, None)
+            _put_latest(self._results, result)
+
+    def stop(self):
+        self._run = False
+        self._thread.join(timeout=1.0)
 
 
 def main_loop():
@@ -91,30 +177,49 @@ def main_loop():
     if cap is None or model is None:
         return
 
+    cam = camera_utils.ThreadedCamera(cap)
+    worker = RecognitionWorker(model)
     cv2.namedWindow("VINA-Face", cv2.WINDOW_AUTOSIZE)
 
     zoom_active = False
     zoom_return_time = 0
     name_to_greet_after_zoom = None
     last_detection_run_time = 0
+    detection_state = "SEARCHING" # "TRACKING" once someone known has been recognized
+    last_face_seen_time = 0
     current_processing_bbox_for_zoom = None
+    last_dropped_log_time = time.monotonic()
+    frame_count = 0
+    scene_is_dark = True
 
     try:
         while True:
-            ret, frame = cap.read()
+            ret, frame = cam.read()
+            if ret is None:
+                cv2.waitKey(1) # No new frame yet (slow start-up or a brief stall); keep the window responsive
+                continue
             if not ret or frame is None:
                 print("Error: No frame from camera. Ending.")
                 time.sleep(0.5)
                 break
             
-            processed_frame = frame.copy()
-            # Reading USE_LOW_LIGHT_ENHANCEMENT is now fine because it was declared global above
-            if USE_LOW_LIGHT_ENHANCEMENT:
-                processed_frame = camera_utils.enhance_contrast(processed_frame)
+            frame_count += 1
+            if frame_count % LOW_LIGHT_CHECK_INTERVAL_FRAMES == 1:
+                scene_is_dark = camera_utils.should_enhance(frame)
 
-            display_frame = frame.copy()
+            # Nothing draws on the display frame and every camera frame is a fresh array, so no copies are needed
+            display_frame = frame
             frame_height, frame_width = frame.shape[:2]
-            current_time = time.time()
+            current_time = time.monotonic() # Immune to wall-clock adjustments; only used for intervals
+
+            if frame_count % GREETED_PRUNE_INTERVAL_FRAMES == 0:
+                # Keeps last_greeted_time from growing for as long as the system runs
+                last_greeted_time = {name: t for name, t in last_greeted_time.items()
+                                     if current_time - t < GREETING_COOLDOWN_SECONDS * 10}
+
+            if current_time - last_dropped_log_time > DROPPED_FRAMES_LOG_INTERVAL_SECONDS:
+                last_dropped_log_time = current_time
+                print(f"Camera: {camera_utils.frames_dropped} stale frames dropped so far.")
 
             # --- Zoom Logic ---
             if zoom_active:
@@ -141,10 +246,24 @@ def main_loop():
                         zoom_active = False
                         name_to_greet_after_zoom = None
 
-            # --- Detection and Recognition Logic ---
-            if not zoom_active and (current_time - last_detection_run_time > DETECTION_INTERVAL_SECONDS):
+            # --- Detection and Recognition Logic (runs on the worker thread) ---
+            detection_interval = TRACKING_DETECTION_INTERVAL_SECONDS if detection_state == "TRACKING" \
+                else DETECTION_INTERVAL_SECONDS
+            if not zoom_active and (current_time - last_detection_run_time > detection_interval):
                 last_detection_run_time = current_time
-                recognized_name, face_bbox = process_frame(processed_frame, model, frame_width, frame_height)
+                # Reading USE_LOW_LIGHT_ENHANCEMENT is now fine because it was declared global above
+                worker.submit(frame, USE_LOW_LIGHT_ENHANCEMENT and scene_is_dark)
+
+            result = worker.poll()
+            if result is not None and not zoom_active: # Results for frames submitted before a zoom started are stale
+                recognized_name, face_bbox = result
+
+                if face_bbox is None:
+                    if current_time - last_face_seen_time > TRACKING_LOST_TIMEOUT_SECONDS:
+                        detection_state = "SEARCHING"
+                else:
+                    last_face_seen_time = current_time
+                    detection_state = "TRACKING" if recognized_name not in (None, "Unknown") else "SEARCHING"
 
                 if face_bbox is not None:
                     current_processing_bbox_for_zoom = face_bbox
@@ -182,6 +301,8 @@ def main_loop():
         import traceback
         traceback.print_exc()
     finally:
+        worker.stop()
+        cam.stop()
         if cap and cap.isOpened():
             cap.release()
         cv2.destroyAllWindows()
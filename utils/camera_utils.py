@@ -1,8 +1,12 @@
 # utils/camera_utils.py
 
 import cv2
+import time
+import threading
 import numpy as np
 
+frames_dropped = 0 # Stale frames discarded by ThreadedCamera, for periodic logging
+
 def list_available_cameras(max_to_test=5): # This function remains for manual debugging if needed
     """Lists available camera indices and their status."""
     available_indices = []
@@ -37,6 +41,7 @@ def get_camera(width=1280, height=720, desired_fps=30):
         temp_cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
         temp_cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
         temp_cap.set(cv2.CAP_PROP_FPS, desired_fps)
+        temp_cap.set(cv2.CAP_PROP_BUFFERSIZE, 1) # Keep as few stale frames queued as the backend allows
 
         actual_width = temp_cap.get(cv2.CAP_PROP_FRAME_WIDTH)
         actual_height = temp_cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
@@ -72,5 +77,75 @@ def get_camera(width=1280, height=720, desired_fps=30):
 
     return cap
 
-def enhance_contrast(frame, alpha=1.2, beta=5):
-    return cv2.convertScaleAbs(frame, alpha=alpha, beta=beta)
\ No newline at end of file
+class ThreadedCamera:
+    """
+    Reads frames from a cv2.VideoCapture on a background thread and keeps only the
+    latest one, so capture and decode overlap with detection in the main loop.
+    """
+
+    def __init__(self, cap):
+        self.cap = cap
+        self._ret = False
+        self._frame = None
+        self._frame_id = 0  # Incremented for every frame the thread captures
+        self._read_id = 0   # Id of the last frame handed out by read()
+        self._cond = threading.Condition()
+        self._run = True
+        self._thread = threading.Thread(target=self._update, daemon=True)
+        self._thread.start()
+
+    def _update(self):
+        global frames_dropped
+        while self._run:
+            ret, frame = self.cap.read()
+            with self._cond:
+                if self._frame_id > self._read_id:
+                    frames_dropped += 1 # The previous frame was overwritten before anyone read it
+                self._ret, self._frame = ret, frame
+                self._frame_id += 1
+                self._cond.notify_all()
+            if not ret:
+                time.sleep(0.1) # Avoid spinning while the camera is unavailable
+
+    def read(self, timeout=1.0):
+        """
+        Returns (ret, frame) for the newest frame not returned before, waiting up to
+        timeout seconds for one. cap.read() allocates a new array per frame, so the
+        frame can be handed out without copying.
+        Returns (None, None) if no new frame arrived in time (e.g. the camera is still
+        starting up); ret is False only when the camera itself failed to read.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._frame_id > self._read_id, timeout=timeout):
+                return None, None
+            self._read_id = self._frame_id
+            return self._ret, self._frame
+
+    def stop(self):
+        """Stops the capture thread. The caller still owns and releases the capture."""
+        self._run = False
+        self._thread.join(timeout=1.0)
+
+_contrast_luts = {} # (alpha, beta) -> 256-entry uint8 lookup table
+
+def _get_contrast_lut(alpha, beta):
+    lut = _contrast_luts.get((alpha, beta))
+    if lut is None:
+        # Same mapping as cv2.convertScaleAbs: saturate(round(|alpha * x + beta|))
+        lut = np.clip(np.round(np.abs(np.arange(256) * alpha + beta)), 0, 255).astype(np.uint8)
+        _contrast_luts[(alpha, beta)] = lut
+    return lut
+
+def enhance_contrast(frame, alpha=1.2, beta=5, dst=None):
+    """
+    Brightens a uint8 frame with a precomputed lookup table (one table lookup per
+    pixel instead of a multiply, add and clip). Pass dst to write into an existing buffer.
+    """
+    return cv2.LUT(frame, _get_contrast_lut(alpha, beta), dst=dst)
+
+def should_enhance(frame, threshold=80):
+    """
+    Returns True if the frame is dark enough to benefit from enhance_contrast.
+    Estimates mean brightness from every 8th pixel in each direction.
+    """
+    return np.mean(frame[::8, ::8]) < threshold
\ No newline at end of file
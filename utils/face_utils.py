@@ -1,69 +1,127 @@
+import functools
 import insightface
 from insightface.app import FaceAnalysis
 import numpy as np
+import onnxruntime as ort
 import pickle
 import os # For path joining
 
+try:
+    import faiss # Optional: approximate nearest-neighbour index for large databases
+except ImportError:
+    faiss = None
+
+try:
+    from numba import njit, prange # Optional: compiled kernel for int8 matching
+except ImportError:
+    njit = None
+
 # Path for the known faces database
 DATABASE_DIR = os.path.dirname(os.path.abspath(__file__)) # utils directory
-KNOWN_FACES_PKL = os.path.join(os.path.dirname(DATABASE_DIR), "known_faces.pkl") # vina_face/known_faces.pkl
+KNOWN_FACES_DB = os.path.join(os.path.dirname(DATABASE_DIR), "known_faces.npz") # vina_face/known_faces.npz
+KNOWN_FACES_PKL = os.path.join(os.path.dirname(DATABASE_DIR), "known_faces.pkl") # Legacy database, read if no .npz exists
+KNOWN_FACES_INDEX = os.path.join(os.path.dirname(DATABASE_DIR), "known_faces.faiss") # FAISS index built from the database
+HNSW_MIN_FACES = 1000 # Below this, an exact flat index is faster than building an HNSW graph
 
+# CoreML: let it use the Neural Engine/GPU (FP16) and the newer MLProgram format
+COREML_PROVIDER_OPTIONS = {'MLComputeUnits': 'ALL', 'ModelFormat': 'MLProgram'}
+# Tried in order; older onnxruntime versions reject the CoreML options above
+SESSION_PROVIDER_CANDIDATES = [
+    (['CoreMLExecutionProvider', 'CPUExecutionProvider'], [COREML_PROVIDER_OPTIONS, {}]),
+    (['CoreMLExecutionProvider', 'CPUExecutionProvider'], [{}, {}]),
+    (['CPUExecutionProvider'], [{}]),
+]
 
-def load_insightface_model():
-    """Loads the InsightFace model."""
-    try:
-        # Try CoreML first for Apple Silicon, then CPU
-        providers = ['CoreMLExecutionProvider', 'CPUExecutionProvider']
-        model = FaceAnalysis(name='buffalo_l', 
-                             allowed_modules=['detection', 'recognition'], 
-                             providers=providers)
-    except Exception as e:
-        print(f"Failed to load InsightFace with CoreMLExecutionProvider: {e}")
-        print("Falling back to CPUExecutionProvider for InsightFace.")
-        providers = ['CPUExecutionProvider']
-        model = FaceAnalysis(name='buffalo_l', 
-                             allowed_modules=['detection', 'recognition'], 
-                             providers=providers)
-    
-    model.prepare(ctx_id=0, det_size=(640, 640)) # det_size can be tuned
-    print("InsightFace model loaded successfully.")
+
+def _make_session_options():
+    sess_options = ort.SessionOptions()
+    sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    sess_options.enable_mem_pattern = True
+    # Leave cores for the capture, render and TTS threads
+    sess_options.intra_op_num_threads = max(1, (os.cpu_count() or 2) // 2)
+    return sess_options
+
+def _configure_sessions(model):
+    """
+    Recreates the ONNX Runtime sessions of a loaded FaceAnalysis model with tuned
+    session and provider options. FaceAnalysis doesn't forward SessionOptions to
+    the sessions it creates, so they are replaced here.
+    Returns the name of the primary execution provider in use.
+    """
+    sess_options = _make_session_options()
+    available = ort.get_available_providers()
+    for providers, provider_options in SESSION_PROVIDER_CANDIDATES:
+        if not all(p in available for p in providers):
+            continue
+        try:
+            sessions = {taskname: ort.InferenceSession(task_model.model_file, sess_options=sess_options,
+                                                       providers=providers, provider_options=provider_options)
+                        for taskname, task_model in model.models.items()}
+        except Exception as e:
+            print(f"Failed to create InsightFace sessions with {providers[0]} ({provider_options[0]}): {e}")
+            continue
+        for taskname, session in sessions.items():
+            model.models[taskname].session = session
+        return providers[0]
+    return None
+
+@functools.lru_cache(maxsize=1)
+def load_insightface_model(det_size=(640, 640)):
+    """
+    Loads the InsightFace model (detection + recognition only).
+    The detector resizes every frame to fit det_size (width, height), so a smaller
+    det_size is faster but misses small or distant faces.
+    Cached, so repeated calls within one process reuse the same ONNX sessions.
+    """
+    # Load on CPU first (cheap), then rebuild the sessions for the best available provider,
+    # so CoreML doesn't compile the models twice.
+    model = FaceAnalysis(name='buffalo_l', 
+                         allowed_modules=['detection', 'recognition'], 
+                         providers=['CPUExecutionProvider'])
+    model.prepare(ctx_id=0, det_size=det_size)
+
+    provider = _configure_sessions(model)
+    if provider is None:
+        print("Could not apply tuned session options. Using default CPU sessions for InsightFace.")
+    print(f"InsightFace model loaded successfully ({provider or 'CPUExecutionProvider'}).")
     return model
 
+def warmup(model=None):
+    """
+    Runs the detection and recognition sessions once on blank input so the first
+    real frame doesn't pay for provider initialization (e.g. CoreML compilation).
+    """
+    if model is None:
+        model = load_insightface_model()
+    model.get(np.zeros((640, 640, 3), dtype=np.uint8))
+    # A blank image has no faces, so prime the recognition session directly
+    model.models['recognition'].get_feat(np.zeros((112, 112, 3), dtype=np.uint8))
+
 def get_faces_from_frame(frame, model):
     """
     Detects faces and extracts embeddings using the InsightFace model.
+    The detector sees the frame resized to the model's det_size; embeddings are
+    extracted from the full-resolution frame.
     Returns a list of InsightFace Face objects.
     """
-    faces = model.get(frame)
-    return faces
+    return model.get(frame)
 
-def get_center_most_face(faces, frame_width, frame_height):
+def get_center_most_face(faces, frame_center_x, frame_center_y):
     """
     Selects the face closest to the center of the frame.
     faces: list of InsightFace Face objects.
+    frame_center_x, frame_center_y: frame center, computed once per frame by the caller.
     """
     if not faces:
         return None
+    if len(faces) == 1:
+        return faces[0]
 
-    frame_center_x = frame_width / 2
-    frame_center_y = frame_height / 2
-    
-    closest_face_obj = None
-    min_dist_sq = float('inf')
-
-    for face_obj in faces:
-        bbox = face_obj.bbox.astype(int)
-        x1, y1, x2, y2 = bbox
-        face_center_x = (x1 + x2) / 2
-        face_center_y = (y1 + y2) / 2
-        
-        dist_sq = (face_center_x - frame_center_x)**2 + (face_center_y - frame_center_y)**2
-        
-        if dist_sq < min_dist_sq:
-            min_dist_sq = dist_sq
-            closest_face_obj = face_obj
-            
-    return closest_face_obj
+    bboxes = np.array([face_obj.bbox for face_obj in faces], dtype=np.float32)
+    face_centers_x = (bboxes[:, 0] + bboxes[:, 2]) * 0.5
+    face_centers_y = (bboxes[:, 1] + bboxes[:, 3]) * 0.5
+    dist_sq = (face_centers_x - frame_center_x) ** 2 + (face_centers_y - frame_center_y) ** 2
+    return faces[int(dist_sq.argmin())]
 
 def compare_embeddings(emb1, emb2):
     """
@@ -76,41 +134,212 @@ def compare_embeddings(emb1, emb2):
     # emb2 = emb2 / np.linalg.norm(emb2)
     return np.dot(emb1, emb2)
 
-def load_known_faces(db_path=KNOWN_FACES_PKL):
-    """Loads known faces from the pickle database."""
+def match_embedding(embedding, db_matrix, names, threshold):
+    """
+    Finds the best match for an embedding against the stacked database matrix.
+    Embeddings are L2 normalized, so the dot product is the cosine similarity.
+    Returns (name, similarity), with name "Unknown" if the best similarity is not above threshold.
+    """
+    if db_matrix is None or len(names) == 0:
+        return "Unknown", -1.0
+
+    sims = db_matrix @ np.asarray(embedding, dtype=np.float32)
+    best_idx = int(np.argmax(sims))
+    best_sim = float(sims[best_idx])
+    if best_sim > threshold:
+        return names[best_idx], best_sim
+    return "Unknown", best_sim
+
+def quantize_embeddings(db_matrix):
+    """
+    Quantizes each row of the embedding matrix to int8 with its own scale.
+    Returns (q_matrix, scales) where db_matrix is approximately q_matrix / scales[:, None].
+    """
+    if len(db_matrix) == 0:
+        return np.zeros((0, db_matrix.shape[1]), dtype=np.int8), np.zeros(0, dtype=np.float32)
+    max_abs = np.max(np.abs(db_matrix), axis=1)
+    scales = (127.0 / np.maximum(max_abs, 1e-12)).astype(np.float32)
+    q_matrix = np.round(db_matrix * scales[:, None]).astype(np.int8)
+    return q_matrix, scales
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _int8_similarities(q_matrix, scales, q_emb):
+        """int8 x int8 dot products accumulated in int32, one row per thread chunk."""
+        sims = np.empty(q_matrix.shape[0], dtype=np.float32)
+        for i in prange(q_matrix.shape[0]):
+            acc = np.int32(0)
+            for j in range(q_matrix.shape[1]):
+                acc += np.int32(q_matrix[i, j]) * q_emb[j]
+            sims[i] = acc / (scales[i] * 127.0)
+        return sims
+else:
+    _int8_similarities = None
+
+def match_embedding_int8(embedding, q_matrix, scales, names, threshold):
+    """
+    Same as match_embedding, but against an int8 matrix from quantize_embeddings.
+    The query is normalized, so it is quantized with a fixed scale of 127.
+    """
+    if q_matrix is None or len(names) == 0:
+        return "Unknown", -1.0
+
+    q_emb = np.round(np.asarray(embedding, dtype=np.float32) * 127.0).astype(np.int32)
+    if _int8_similarities is not None:
+        # Reads the int8 rows directly, without a widened copy of the matrix
+        sims = _int8_similarities(q_matrix, scales, q_emb)
+    else:
+        # Accumulate in int32; an int8 dot product of 512 elements would overflow
+        sims = (q_matrix.astype(np.int32) @ q_emb) / (scales * 127.0)
+    best_idx = int(np.argmax(sims))
+    best_sim = float(sims[best_idx])
+    if best_sim > threshold:
+        return names[best_idx], best_sim
+    return "Unknown", best_sim
+
+def build_index(db_matrix):
+    """
+    Builds a FAISS inner-product index over the embedding matrix.
+    Uses an exact flat index for small databases and HNSW for large ones.
+    Returns None if FAISS is not installed or the database is empty.
+    """
+    if faiss is None or len(db_matrix) == 0:
+        return None
+
+    dim = db_matrix.shape[1]
+    if len(db_matrix) < HNSW_MIN_FACES:
+        index = faiss.IndexFlatIP(dim)
+    else:
+        index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+    index.add(np.ascontiguousarray(db_matrix, dtype=np.float32))
+    return index
+
+def load_or_build_index(db_matrix, index_path=KNOWN_FACES_INDEX, db_path=KNOWN_FACES_DB):
+    """
+    Loads the FAISS index saved next to the database if it is still up to date,
+    otherwise builds it from db_matrix and saves it.
+    """
+    if faiss is None or len(db_matrix) == 0:
+        return None
+
+    db_file = _npz_path(db_path)
+    if not os.path.exists(db_file):
+        db_file = os.path.splitext(db_path)[0] + ".pkl"
+    try:
+        if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(db_file):
+            index = faiss.read_index(index_path)
+            if index.ntotal == len(db_matrix) and index.d == db_matrix.shape[1]:
+                print(f"Loaded FAISS index from {index_path}.")
+                return index
+    except Exception as e:
+        print(f"Could not load FAISS index from {index_path} (Error: {e}). Rebuilding.")
+
+    index = build_index(db_matrix)
+    try:
+        faiss.write_index(index, index_path)
+    except Exception as e:
+        print(f"Error saving FAISS index: {e}")
+    return index
+
+def search_index(embedding, index, names, threshold):
+    """
+    Same as match_embedding, but queries a FAISS index from build_index.
+    """
+    if index is None or len(names) == 0:
+        return "Unknown", -1.0
+
+    query = np.ascontiguousarray(np.asarray(embedding, dtype=np.float32)[None])
+    sims, idxs = index.search(query, 1)
+    best_idx = int(idxs[0, 0])
+    best_sim = float(sims[0, 0])
+    if best_idx >= 0 and best_sim > threshold:
+        return names[best_idx], best_sim
+    return "Unknown", best_sim
+
+def _npz_path(db_path):
+    """The .npz database file for a database path given with or without extension."""
+    return os.path.splitext(db_path)[0] + ".npz"
+
+def load_known_faces(db_path=KNOWN_FACES_DB):
+    """
+    Loads known faces from the .npz database, falling back to the legacy pickle
+    database next to it if no .npz has been saved yet.
+    Returns (names, embeddings): a list of names and a contiguous (N, 512) float32 matrix.
+    """
+    npz_path = _npz_path(db_path)
+    if os.path.exists(npz_path):
+        try:
+            # Plain arrays only (allow_pickle stays off): a names string array and one embeddings slab.
+            # Embeddings are stored as float16 and widened once here for the float32 matmul/FAISS paths.
+            with np.load(npz_path) as data:
+                names = data['names'].tolist()
+                embeddings = np.ascontiguousarray(data['embeddings'], dtype=np.float32)
+            print(f"Loaded {len(names)} known faces.")
+            return names, embeddings
+        except Exception as e:
+            print(f"Could not load known faces from {npz_path} (Error: {e}). Trying the legacy pickle database.")
+    return _load_known_faces_pkl(os.path.splitext(db_path)[0] + ".pkl")
+
+def _empty_known_faces():
+    return [], np.zeros((0, 512), dtype=np.float32)
+
+def _load_known_faces_pkl(db_path):
+    """Loads known faces from the legacy pickle database (a list of {'name', 'embedding'} dicts)."""
     try:
         with open(db_path, 'rb') as f:
             data = pickle.load(f)
-            valid_data = []
-            if isinstance(data, list):
-                for item in data:
-                    if isinstance(item, dict) and 'name' in item and 'embedding' in item:
-                        # Ensure embedding is numpy array and float32
-                        item['embedding'] = np.array(item['embedding'], dtype=np.float32)
-                        if isinstance(item['name'], str):
-                            valid_data.append(item)
-                        else:
-                            print(f"Warning: Skipping item with non-string name: {item}")
-                    else:
-                        print(f"Warning: Skipping malformed item in database: {item}")
-                print(f"Loaded {len(valid_data)} known faces.")
-                return valid_data
-            else:
-                print("Warning: Database file is not a list. Initializing new database.")
-                return []
     except (FileNotFoundError, EOFError, pickle.UnpicklingError) as e:
         print(f"Could not load known faces from {db_path} (Error: {e}). Starting with an empty database.")
-        return []
+        return _empty_known_faces()
     except Exception as e:
         print(f"An unexpected error occurred while loading known faces: {e}")
-        return []
+        return _empty_known_faces()
+
+    if not isinstance(data, list):
+        print("Warning: Database file is not a list. Initializing new database.")
+        return _empty_known_faces()
 
+    valid = [item for item in data
+             if isinstance(item, dict) and isinstance(item.get('name'), str) and 'embedding' in item]
+    if len(valid) < len(data):
+        print(f"Warning: Skipped {len(data) - len(valid)} malformed items in database.")
+    if not valid:
+        return _empty_known_faces()
 
-def save_known_faces(data, db_path=KNOWN_FACES_PKL):
-    """Saves known faces to the pickle database."""
+    names = [item['name'] for item in valid]
+    embeddings = np.vstack([np.asarray(item['embedding'], dtype=np.float32) for item in valid])
+    print(f"Loaded {len(names)} known faces.")
+    return names, embeddings
+
+def update_known_faces(names, embeddings, new_faces):
+    """
+    Adds faces to a (names, embeddings) database, replacing entries with the same name.
+    new_faces: dict of name -> embedding.
+    Returns the updated (names, embeddings).
+    """
+    keep = [i for i, name in enumerate(names) if name not in new_faces]
+    names = [names[i] for i in keep] + list(new_faces)
+    embeddings = np.vstack([embeddings[keep]] +
+                           [np.asarray(emb, dtype=np.float32).reshape(1, -1) for emb in new_faces.values()])
+    return names, embeddings
+
+
+def save_known_faces(data, db_path=KNOWN_FACES_DB):
+    """
+    Saves known faces to the .npz database, with embeddings stored as float16.
+    data: list of {'name', 'embedding'} dicts, or a (names, embeddings) tuple.
+    """
     try:
-        with open(db_path, 'wb') as f:
-            pickle.dump(data, f)
-        print(f"Known faces database saved to {db_path} with {len(data)} entries.")
+        if isinstance(data, tuple):
+            names, embeddings = data
+        else:
+            names = [item['name'] for item in data]
+            embeddings = [item['embedding'] for item in data]
+        # Normalized embeddings keep ~1e-3 precision in float16, far below the match threshold margins
+        embeddings = np.vstack(embeddings).astype(np.float16) if len(names) \
+            else np.zeros((0, 512), dtype=np.float16)
+        npz_path = _npz_path(db_path)
+        np.savez(npz_path, names=np.asarray(names, dtype=str), embeddings=embeddings)
+        print(f"Known faces database saved to {npz_path} with {len(names)} entries.")
     except Exception as e:
-        print(f"Error saving known faces database: {e}")
\ No newline at end of file
+        print(f"Error saving known faces database: {e}")
@@ -1,42 +1,55 @@
+import queue
 import subprocess
 import threading
 import time
 
-# Simple mechanism to prevent spamming TTS if multiple quick recognitions for same person
-# This is a global lock for any speech. For per-person cooldown, use main.py logic.
-tts_lock = threading.Lock()
-last_tts_call_time = 0
-TTS_MIN_INTERVAL = 0.5  # Minimum interval between any two 'say' calls to prevent overlap issues
+TTS_QUEUE_SIZE = 4  # Pending messages; new ones are dropped while the queue is full
+PER_TEXT_COOLDOWN = 3.0  # Seconds before the same text is spoken again; different texts aren't held back
 
-def speak(text):
+_tts_queue = queue.Queue(maxsize=TTS_QUEUE_SIZE)
+_last_spoken = {}  # text -> time.monotonic() it was last spoken; only touched by the worker thread
+
+def _speak_task(text):
     """
-    Speaks the given text using macOS 'say' command in a non-blocking thread.
-    Ensures 'say' commands don't excessively overlap.
+    Speaks the given text with the macOS 'say' command, blocking until it finishes,
+    unless it was spoken very recently.
     """
-    global last_tts_call_time
+    global _last_spoken
+    now = time.monotonic()
+    last = _last_spoken.get(text)
+    if last is not None and now - last < PER_TEXT_COOLDOWN:
+        return
+    _last_spoken[text] = now
+    if len(_last_spoken) > 128:
+        # Keep the 64 most recently spoken texts
+        _last_spoken = dict(sorted(_last_spoken.items(), key=lambda item: -item[1])[:64])
+
+    try:
+        # print(f"TTS: {text}") # For debugging
+        # One 'say' per message: with stdin piped instead of a terminal, 'say' only
+        # speaks once stdin is closed, so a long-lived process would stay silent
+        subprocess.run(['say', text], check=True)
+    except FileNotFoundError:
+        print("Error: 'say' command not found. Ensure you are on macOS.")
+    except subprocess.CalledProcessError as e:
+        print(f"Error during 'say' command execution: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred in TTS: {e}")
+
+def _tts_worker():
+    while True:
+        _speak_task(_tts_queue.get())
 
-    def _speak_task():
-        global last_tts_call_time
-        with tts_lock: # Ensure only one thread modifies last_tts_call_time or calls 'say' at once
-            current_time = time.time()
-            if current_time - last_tts_call_time < TTS_MIN_INTERVAL:
-                # If called too quickly, could wait, but for now, let's just skip if too close.
-                # 'say' itself queues, so this is more about not flooding the 'say' process spawner.
-                # print(f"TTS call too soon for: {text}. Skipping.") # Optional debug
-                return 
-            
-            try:
-                # print(f"TTS: {text}") # For debugging
-                subprocess.run(['say', text], check=True)
-                last_tts_call_time = time.time() # Update time after successful call
-            except FileNotFoundError:
-                print("Error: 'say' command not found. Ensure you are on macOS.")
-            except subprocess.CalledProcessError as e:
-                print(f"Error during 'say' command execution: {e}")
-            except Exception as e:
-                print(f"An unexpected error occurred in TTS: {e}")
+# The single consumer of the queue; daemon so the main program can exit while it is speaking
+threading.Thread(target=_tts_worker, daemon=True).start()
 
-    # Run in a separate thread to avoid blocking the main (OpenCV) loop
-    thread = threading.Thread(target=_speak_task)
-    thread.daemon = True  # Allows main program to exit even if TTS thread is active
-    thread.start()
\ No newline at end of file
+def speak(text):
+    """
+    Queues the given text to be spoken by the background TTS worker and returns
+    immediately, so the main (OpenCV) loop never waits on 'say'.
+    If TTS_QUEUE_SIZE messages are already pending, the text is dropped.
+    """
+    try:
+        _tts_queue.put_nowait(text)
+    except queue.Full:
+        pass
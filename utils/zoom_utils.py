@@ -1,54 +1,370 @@
-import cv2
+import functools
+import os
+import threading
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
-def get_zoomed_region(frame, bbox, target_display_size, padding_factor=0.3):
+# Enlarge crops that are exactly 2x, 3x, ... smaller than the target by pixel replication
+# (INTER_NEAREST_EXACT) instead of bilinear. Much cheaper, but the zoomed face looks blocky.
+NEAREST_INTEGER_UPSCALE = False
+
+_cv2 = None
+
+def _get_cv2():
     """
-    Crops a region around the bounding box, adds padding, and resizes to target_display_size.
-    
-    Args:
-        frame (np.ndarray): The original full frame.
-        bbox (tuple/list/np.ndarray): Bounding box (x1, y1, x2, y2).
-        target_display_size (tuple): Desired output size (width, height).
-        padding_factor (float): Percentage to expand the bounding box by (e.g., 0.2 for 20%).
-                                This factor is applied to width and height independently.
-                                Total added padding = padding_factor * dimension.
-
-    Returns:
-        np.ndarray: The zoomed and resized region, or None if issues occur.
-    """
-    if frame is None or bbox is None:
-        return None
+    Imports OpenCV on first use. Importing cv2 (and numba, PIL) is slow, and processes
+    that import this module without zooming (e.g. multiprocessing workers) shouldn't pay for it.
+    """
+    global _cv2
+    if _cv2 is None:
+        import cv2
+        _cv2 = cv2
+    return _cv2
+
+_pil_image = False # False until checked; then the PIL.Image module if pillow-simd is installed, else None
 
-    x1, y1, x2, y2 = map(int, bbox)
-    fh, fw = frame.shape[:2]
-    
+def _get_pil_simd():
+    """Imports PIL on first use. Returns PIL.Image if pillow-simd is installed, else None."""
+    global _pil_image
+    if _pil_image is False:
+        try:
+            import PIL
+            from PIL import Image
+            # pillow-simd (SSE4/AVX2 resize kernels) releases are versioned 'X.Y.Z.postN'; plain Pillow isn't faster than OpenCV
+            _pil_image = Image if '.post' in PIL.__version__ else None
+        except ImportError:
+            _pil_image = None
+    return _pil_image
+
+def _choose_interpolation(crop_w, crop_h, target_display_size, allow_nearest=True):
+    """
+    INTER_AREA when shrinking in both directions (it averages source pixels instead of
+    skipping them, and has fast paths for this, including exact integer ratios),
+    INTER_LINEAR otherwise, since zoomed faces are usually enlarged and nearest-neighbour
+    would look blocky. With NEAREST_INTEGER_UPSCALE, exact integer upscales use
+    INTER_NEAREST_EXACT, unless allow_nearest is False (cv2.cuda.resize doesn't support it).
+    """
+    cv2 = _get_cv2()
+    target_w, target_h = target_display_size
+    if target_w < crop_w and target_h < crop_h:
+        return cv2.INTER_AREA
+    if NEAREST_INTEGER_UPSCALE and allow_nearest and target_w % crop_w == 0 and target_h % crop_h == 0 \
+            and target_w // crop_w == target_h // crop_h:
+        # INTER_NEAREST_EXACT needs OpenCV 4.5.1+; plain INTER_NEAREST also replicates whole pixels here
+        return getattr(cv2, 'INTER_NEAREST_EXACT', cv2.INTER_NEAREST)
+    return cv2.INTER_LINEAR
+
+def _crop_rect(x1, y1, x2, y2, fw, fh, padding_factor):
+    """
+    Pads an integer bounding box and clips it to a fw x fh frame.
+    Returns (crop_x1, crop_y1, crop_x2, crop_y2), or (-1, -1, -1, -1) for an invalid box.
+    Scalar-only so numba can compile it.
+    """
     bb_w, bb_h = x2 - x1, y2 - y1
     if bb_w <= 0 or bb_h <= 0:
-        return None # Invalid bounding box
+        return -1, -1, -1, -1
 
-    # Calculate padding
     pad_w = int(bb_w * padding_factor)
     pad_h = int(bb_h * padding_factor)
+    crop_x1 = min(max(x1 - pad_w, 0), fw)
+    crop_y1 = min(max(y1 - pad_h, 0), fh)
+    crop_x2 = min(max(x2 + pad_w, 0), fw)
+    crop_y2 = min(max(y2 + pad_h, 0), fh)
+    return crop_x1, crop_y1, crop_x2, crop_y2
+
+_crop_rect_fn = None # _crop_rect, compiled with numba on first use if it is installed
+
+def _get_crop_rect():
+    global _crop_rect_fn
+    if _crop_rect_fn is None:
+        try:
+            from numba import njit # Optional: compiles the crop geometry to native code
+            _crop_rect_fn = njit(cache=True, fastmath=True)(_crop_rect)
+        except ImportError:
+            _crop_rect_fn = _crop_rect
+    return _crop_rect_fn
+
+def warmup():
+    """
+    Loads the zoom dependencies and compiles the crop geometry once on dummy values,
+    so the first real zoom (right after the first greeting) doesn't stall the display.
+    """
+    _get_cv2()
+    _get_pil_simd()
+    _compute_crop((0, 0, 1, 1), 2, 2, 0.3) # Same argument types as real calls, so numba compiles the right signature
 
-    # New coordinates with padding
-    crop_x1 = max(0, x1 - pad_w)
-    crop_y1 = max(0, y1 - pad_h)
-    crop_x2 = min(fw, x2 + pad_w)
-    crop_y2 = min(fh, y2 + pad_h)
+def _compute_crop(bbox, fw, fh, padding_factor):
+    """
+    Pads the bounding box and clips it to the frame.
+    Returns (crop_x1, crop_y1, crop_x2, crop_y2) as ints, or None for an invalid box.
+    """
+    # Both truncate like int(): one conversion call for arrays, no temporary array for tuples/lists
+    if isinstance(bbox, np.ndarray):
+        x1, y1, x2, y2 = bbox.astype(np.int32).tolist()
+    else:
+        x1, y1, x2, y2 = int(bbox[0]), int(bbox[1]), int(bbox[2]), int(bbox[3])
+    crop = _get_crop_rect()(x1, y1, x2, y2, fw, fh, padding_factor)
+    if crop[0] < 0:
+        return None
+    return crop
 
-    # Crop the region
-    cropped_region = frame[crop_y1:crop_y2, crop_x1:crop_x2]
+def _pil_resize(cropped_region, target_display_size, interpolation):
+    """
+    Resizes a uint8 3-channel image with pillow-simd. The channels are passed through
+    as 'RGB' without swapping: resizing treats each channel independently, so BGR in
+    gives BGR out. Returns a new (read-only) array.
+    """
+    cv2 = _get_cv2()
+    Image = _get_pil_simd()
+    resampling = getattr(Image, 'Resampling', Image)
+    if interpolation == cv2.INTER_AREA:
+        resample = resampling.BOX
+    elif interpolation in (cv2.INTER_NEAREST, getattr(cv2, 'INTER_NEAREST_EXACT', cv2.INTER_NEAREST)):
+        resample = resampling.NEAREST
+    else:
+        resample = resampling.BILINEAR
+    return np.asarray(Image.fromarray(cropped_region, 'RGB').resize(target_display_size, resample))
+
+def compute_crop_rects(bboxes, frame_shape, padding_factor=0.3):
+    """
+    Vectorized _compute_crop for many boxes: pads and clips an (N, 4) array of
+    (x1, y1, x2, y2) boxes to the frame in one pass.
+    Returns an (N, 4) int32 array of crop rectangles; rows of invalid boxes are -1.
+    """
+    boxes = np.asarray(bboxes).reshape(-1, 4).astype(np.int32) # Truncates like int()
+    widths = boxes[:, 2] - boxes[:, 0]
+    heights = boxes[:, 3] - boxes[:, 1]
+    pads = (np.stack([widths, heights], axis=1) * padding_factor).astype(np.int32)
+    crops = boxes + np.concatenate([-pads, pads], axis=1)
+    fh, fw = frame_shape[:2]
+    np.clip(crops, 0, [fw, fh, fw, fh], out=crops)
+    crops[(widths <= 0) | (heights <= 0)] = -1
+    return crops
+
+def _black_shape(frame, target_display_size):
+    return (target_display_size[1], target_display_size[0], frame.shape[2] if frame.ndim == 3 else 1)
+
+_BLACK_CACHE = {} # (shape, dtype) -> black image, shared by all renderers and threads
+
+def _black(shape, dtype):
+    """
+    Returns a black image of the given shape and dtype, allocated once per (shape, dtype).
+    The array is shared and marked read-only; copy it before drawing on it.
+    """
+    key = (shape, np.dtype(dtype))
+    buf = _BLACK_CACHE.get(key)
+    if buf is None:
+        buf = np.zeros(shape, dtype=dtype)
+        buf.flags.writeable = False
+        _BLACK_CACHE[key] = buf
+    return buf
+
+class ZoomRenderer:
+    """
+    Renders zoomed regions into an output buffer that is reused across calls.
+    The buffer is only reallocated when the target size, channel count or dtype changes.
+    """
 
-    if cropped_region.size == 0:
-        # Fallback: return a black image of target_display_size
-        return np.zeros((target_display_size[1], target_display_size[0], frame.shape[2] if frame.ndim == 3 else 1), dtype=frame.dtype)
+    def __init__(self):
+        self._dst = None
 
-    # Resize to the target display size (e.g., full window size)
+    def _get_dst(self, shape, dtype):
+        if self._dst is None or self._dst.shape != shape or self._dst.dtype != dtype:
+            self._dst = np.empty(shape, dtype=dtype)
+        return self._dst
+
+    def get_zoomed_region(self, frame, bbox, target_display_size, padding_factor=0.3):
+        """
+        Crops a region around the bounding box, adds padding, and resizes to target_display_size.
+
+        Args:
+            frame (np.ndarray): The original full frame.
+            bbox (tuple/list/np.ndarray): Bounding box (x1, y1, x2, y2).
+            target_display_size (tuple): Desired output size (width, height).
+            padding_factor (float): Percentage to expand the bounding box by (e.g., 0.2 for 20%).
+                                    This factor is applied to width and height independently.
+                                    Total added padding = padding_factor * dimension.
+
+        Returns:
+            np.ndarray: The zoomed and resized region, or None if issues occur.
+                        The array is a buffer reused by the next call; copy it to keep it.
+                        The black fallback image is shared and read-only.
+        """
+        if frame is None or bbox is None:
+            return None
+
+        fh, fw = frame.shape[0], frame.shape[1]
+        # New coordinates with padding, clipped to the frame
+        crop = _compute_crop(bbox, fw, fh, padding_factor)
+        if crop is None:
+            return None # Invalid bounding box
+        return self.render_crop(frame, crop, target_display_size)
+
+    def render_crop(self, frame, crop, target_display_size):
+        """
+        Resizes the already padded and clipped crop rectangle (crop_x1, crop_y1, crop_x2, crop_y2)
+        of frame to target_display_size. Returns the same as get_zoomed_region.
+        """
+        cv2 = _get_cv2()
+        crop_x1, crop_y1, crop_x2, crop_y2 = crop
+        crop_w, crop_h = crop_x2 - crop_x1, crop_y2 - crop_y1
+        if crop_w <= 0 or crop_h <= 0:
+            # Fallback: return a black image of target_display_size
+            return _black(_black_shape(frame, target_display_size), frame.dtype)
+
+        # Crop the region. This is a view into frame, not a copy: cv2.resize reads the crop's
+        # pixels straight from the frame, so crop + resize is already a single pass
+        # (and cheaper than an equivalent cv2.warpAffine, which lacks resize's fast paths).
+        cropped_region = frame[crop_y1:crop_y2, crop_x1:crop_x2]
+
+        # Camera frames are C-contiguous uint8 BGR, whose crops always have packed pixels;
+        # only other inputs need the layout check.
+        is_bgr8 = frame.dtype == np.uint8 and frame.ndim == 3 and frame.shape[2] == 3
+        if not (is_bgr8 and frame.flags.c_contiguous) and cropped_region.ndim == 3 \
+                and cropped_region.strides[1] != cropped_region.itemsize * cropped_region.shape[2]:
+            # Pixels aren't packed (unusual input layout); OpenCV needs packed pixels within a row
+            cropped_region = np.ascontiguousarray(cropped_region)
+
+        if crop_w == target_display_size[0] and crop_h == target_display_size[1]:
+            # Already the target size: nothing to interpolate. A full-width crop is returned as a
+            # view of frame; otherwise rows aren't adjacent and this makes one contiguous copy.
+            return np.ascontiguousarray(cropped_region)
+
+        # Resize to the target display size (e.g., full window size)
+        interpolation = _choose_interpolation(crop_w, crop_h, target_display_size)
+        if is_bgr8 and _get_pil_simd() is not None:
+            return _pil_resize(cropped_region, target_display_size, interpolation)
+        try:
+            dst = self._get_dst((target_display_size[1], target_display_size[0]) + frame.shape[2:], frame.dtype)
+            zoomed_image = cv2.resize(cropped_region, target_display_size, dst=dst, interpolation=interpolation)
+        except cv2.error as e:
+            print(f"OpenCV resize error: {e}. Cropped region shape: {cropped_region.shape}, target: {target_display_size}")
+            # Fallback: return a black image or the unresized crop if it fits (less ideal)
+            return _black(_black_shape(frame, target_display_size), frame.dtype)
+
+        return zoomed_image
+
+_thread_renderers = threading.local() # One ZoomRenderer per calling thread
+
+def get_zoomed_region(frame, bbox, target_display_size, padding_factor=0.3):
+    """
+    Crops a region around the bounding box, adds padding, and resizes to target_display_size.
+    See ZoomRenderer.get_zoomed_region. Each calling thread gets its own renderer, so this
+    is safe to call from several threads at once; cv2.resize runs without holding the GIL.
+    """
+    renderer = getattr(_thread_renderers, 'renderer', None)
+    if renderer is None:
+        renderer = _thread_renderers.renderer = ZoomRenderer()
+    return renderer.get_zoomed_region(frame, bbox, target_display_size, padding_factor)
+
+@functools.lru_cache(maxsize=1)
+def has_cuda():
+    """True if OpenCV was built with CUDA and a CUDA device is available."""
+    cv2 = _get_cv2()
     try:
-        zoomed_image = cv2.resize(cropped_region, target_display_size, interpolation=cv2.INTER_LINEAR)
-    except cv2.error as e:
-        print(f"OpenCV resize error: {e}. Cropped region shape: {cropped_region.shape}, target: {target_display_size}")
-        # Fallback: return a black image or the unresized crop if it fits (less ideal)
-        return np.zeros((target_display_size[1], target_display_size[0], frame.shape[2] if frame.ndim == 3 else 1), dtype=frame.dtype)
-        
-    return zoomed_image
\ No newline at end of file
+        return cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except (AttributeError, cv2.error): # OpenCV built without the CUDA modules
+        return False
+
+class GpuZoomRenderer:
+    """
+    Zooms into frames that are already on the GPU (cv2.cuda_GpuMat), so the crop and
+    resize happen on-device. Requires an OpenCV build with CUDA (see has_cuda()).
+    The device and host output buffers are reused across calls.
+    """
+
+    def __init__(self):
+        self._stream = _get_cv2().cuda_Stream()
+        self._gpu_dst = None
+        self._host_dst = None
+        self._host_dst_pinned = False
+
+    def _get_host_dst(self, shape):
+        cv2 = _get_cv2()
+        if self._host_dst is None or self._host_dst.shape != shape:
+            if self._host_dst_pinned:
+                cv2.cuda.unregisterPageLocked(self._host_dst)
+                self._host_dst_pinned = False
+            self._host_dst = np.empty(shape, dtype=np.uint8)
+            try:
+                # Pin the numpy buffer itself so downloads go straight into page-locked memory
+                # (cv2.cuda_HostMem(...).createMatHeader() would hand back a pageable copy)
+                cv2.cuda.registerPageLocked(self._host_dst)
+                self._host_dst_pinned = True
+            except (AttributeError, cv2.error):
+                pass # Pageable memory still works, just with a slower download
+        return self._host_dst
+
+    def __del__(self):
+        if self._host_dst_pinned:
+            try:
+                _get_cv2().cuda.unregisterPageLocked(self._host_dst)
+            except Exception:
+                pass
+
+    def get_zoomed_region(self, gpu_frame, bbox, target_display_size, padding_factor=0.3, download=True):
+        """
+        Same as get_zoomed_region, for a uint8 cv2.cuda_GpuMat frame.
+        With download=False, returns the resized cv2.cuda_GpuMat without copying it to
+        the host, for callers that keep processing on the GPU. Either way the result is a
+        buffer owned by the renderer (self._gpu_dst or the host buffer) that the next call
+        overwrites; copy it to keep it.
+        Returns None for an invalid or empty crop.
+        """
+        if gpu_frame is None or bbox is None:
+            return None
+
+        fw, fh = gpu_frame.size()
+        crop = _compute_crop(bbox, fw, fh, padding_factor)
+        if crop is None:
+            return None
+        crop_x1, crop_y1, crop_x2, crop_y2 = crop
+        if crop_x2 <= crop_x1 or crop_y2 <= crop_y1:
+            return None
+
+        cv2 = _get_cv2()
+        cropped_region = gpu_frame.rowRange(crop_y1, crop_y2).colRange(crop_x1, crop_x2) # No copy
+        interpolation = _choose_interpolation(crop_x2 - crop_x1, crop_y2 - crop_y1, target_display_size,
+                                              allow_nearest=False)
+        self._gpu_dst = cv2.cuda.resize(cropped_region, target_display_size, dst=self._gpu_dst,
+                                        interpolation=interpolation, stream=self._stream)
+        if not download:
+            self._stream.waitForCompletion()
+            return self._gpu_dst
+
+        host_dst = self._get_host_dst((target_display_size[1], target_display_size[0], gpu_frame.channels()))
+        self._gpu_dst.download(self._stream, host_dst)
+        self._stream.waitForCompletion()
+        return host_dst
+
+_zoom_pool = None # Created on first use by get_zoomed_regions_batch
+_batch_renderers = [] # One renderer (and output buffer) per bbox slot in a batch
+
+def _get_zoom_pool():
+    global _zoom_pool
+    if _zoom_pool is None:
+        # Parallelize across crops instead of inside each resize, so the workers
+        # don't oversubscribe the cores with OpenCV's own threads
+        _get_cv2().setNumThreads(1)
+        _zoom_pool = ThreadPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) // 2))
+    return _zoom_pool
+
+def get_zoomed_regions_batch(frame, bboxes, target_display_size, padding_factor=0.3):
+    """
+    Zooms into several bounding boxes of the same frame, one crop per worker thread
+    (cv2.resize releases the GIL). Returns one result per bbox, as get_zoomed_region.
+    Each result is a buffer reused by the next batch call; not safe to call from several threads at once.
+    Note: the first call switches OpenCV to single-threaded operations for the whole process.
+    """
+    if frame is None or len(bboxes) == 0:
+        return [None] * len(bboxes)
+
+    # All the geometry in one vectorized pass; only the resizes are per box
+    crops = compute_crop_rects(bboxes, frame.shape, padding_factor).tolist()
+    pool = _get_zoom_pool()
+    while len(_batch_renderers) < len(crops):
+        _batch_renderers.append(ZoomRenderer())
+    futures = [pool.submit(_batch_renderers[i].render_crop, frame, crop, target_display_size)
+               if crop[0] >= 0 else None
+               for i, crop in enumerate(crops)]
+    return [future.result() if future is not None else None for future in futures]